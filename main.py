@@ -1,30 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse
+import functools
+import json
 import logging
+import os
 import socket
 import sys
+import time
+from collections.abc import Iterable
 from ipaddress import IPv4Address
-from typing import Annotated
-
-import dns.exception
-import dns.query
-import dns.rcode
-import dns.tsigkeyring
-import dns.update
-import psutil
-from pydantic import Field, IPvAnyAddress
-from pydantic_settings import (
-    BaseSettings,
-    PydanticBaseSettingsSource,
-    SettingsConfigDict,
-    TomlConfigSettingsSource,
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Annotated
+
+from pydantic import (
+    AliasChoices,
+    BaseModel,
+    ConfigDict,
+    Field,
+    IPvAnyAddress,
+    field_validator,
 )
 
+# psutil 和 dns.* 在使用处按需导入，减少 --help 等场景的启动耗时
+if TYPE_CHECKING:
+    import dns.update
+
 
 # 定义TSIG密钥模型
-class TSIGKey(BaseSettings):
+class TSIGKey(BaseModel):
     name: Annotated[str, Field(description="TSIG密钥名称")] = ""
     algorithm: Annotated[
         str,
@@ -34,17 +39,27 @@ class TSIGKey(BaseSettings):
         ),
     ] = "hmac-sha256"
     secret: Annotated[str, Field(description="TSIG密钥(Base64编码)")] = ""
-    model_config = SettingsConfigDict()
+    model_config = ConfigDict(extra="forbid")
 
 
 # 定义配置模型
-class Config(BaseSettings):
+class Config(BaseModel):
     tsig: list[TSIGKey] = []
-    name_server: Annotated[IPvAnyAddress | None, Field(description="DNS服务器地址")] = (
-        None
-    )
+    name_servers: Annotated[
+        list[IPvAnyAddress],
+        Field(
+            description="DNS服务器地址列表",
+            validation_alias=AliasChoices("name_servers", "name_server"),
+        ),
+    ] = []
     zone: Annotated[str, Field(description="DNS区域", pattern=r"^.+\.?$")] = ""
-    hostname: Annotated[str, Field(description="更新记录的主机名")] = ""
+    hostnames: Annotated[
+        list[str],
+        Field(
+            description="更新记录的主机名列表",
+            validation_alias=AliasChoices("hostnames", "hostname"),
+        ),
+    ] = []
     ttl: Annotated[int, Field(description="DNS记录TTL")] = 3600
     timeout: Annotated[int, Field(description="连接超时(秒)")] = 5
     protocol: Annotated[
@@ -62,224 +77,631 @@ class Config(BaseSettings):
             pattern=r"^(info|debug)$",
         ),
     ] = "info"
+    # 默认值在导入时由 Path.home() 生成，本身就是合法路径，不需要经过校验
+    state_file: Annotated[
+        str, Field(description="记录上次成功更新结果的状态文件路径")
+    ] = str(Path.home() / ".cache" / "ddns" / "state.json")
 
-    model_config = SettingsConfigDict(
-        toml_file="config.toml",
-    )
+    model_config = ConfigDict(extra="forbid")
+
+    # log_level 已由 pattern 校验，这里直接映射为 logging 的级别常量
+    @property
+    def logging_level(self) -> int:
+        return logging.DEBUG if self.log_level == "debug" else logging.INFO
 
+    # 确保zone以点号结尾
+    @field_validator("zone")
     @classmethod
-    def settings_customise_sources(
-        cls,
-        settings_cls: type[BaseSettings],
-        init_settings: PydanticBaseSettingsSource,
-        env_settings: PydanticBaseSettingsSource,
-        dotenv_settings: PydanticBaseSettingsSource,
-        file_secret_settings: PydanticBaseSettingsSource,
-    ) -> tuple[PydanticBaseSettingsSource, ...]:
-        return init_settings, TomlConfigSettingsSource(settings_cls=settings_cls)
+    def _absolute_zone(cls, v: str) -> str:
+        return v if v.endswith(".") else v + "."
 
+    @field_validator("hostnames", "name_servers", mode="before")
+    @classmethod
+    def _single_value(cls, v):
+        # 兼容旧配置中单个字符串形式的 hostname 和 name_server
+        return [v] if isinstance(v, str) else v
+
+
+# 读取配置文件并合并命令行参数，一次性校验；配置文件不存在时只使用命令行参数
+def load_config(path: str, overrides: dict) -> Config:
+    import tomllib
+
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except FileNotFoundError:
+        data = {}
+    # 命令行参数同时覆盖配置文件中旧的单值写法
+    for field, legacy in (("hostnames", "hostname"), ("name_servers", "name_server")):
+        if field in overrides:
+            data.pop(legacy, None)
+    return Config.model_validate({**data, **overrides})
 
-# 配置日志格式
-def setup_logging(log_level):
-    level_map = {
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    }
-    level = level_map.get(log_level.lower(), logging.INFO)
 
+# 配置日志格式
+def setup_logging(level: int):
     logging.basicConfig(
         level=level,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         handlers=[
-            logging.FileHandler("ddns.log", encoding="utf-8"),
+            logging.FileHandler("ddns.log", encoding="utf-8", delay=True),
             logging.StreamHandler(sys.stdout),
         ],
     )
     return logging.getLogger("ddns")
 
 
+# 需要检查的接口名称(小写)，按优先级排列；用元组而不是集合，保证选择结果稳定
+_SPECIAL_INTERFACES = ("wlan", "以太网", "ethernet")
+
+
+# 缓存网络接口信息，同一时间桶内不重复枚举接口
+@functools.lru_cache(maxsize=1)
+def _net_if_addrs_cached(bucket: int):
+    import psutil
+
+    return psutil.net_if_addrs()
+
+
+# 缓存默认接口的查找结果，返回 _SPECIAL_INTERFACES 中第一个存在的接口
+@functools.lru_cache(maxsize=1)
+def _special_interface_name(bucket: int) -> str | None:
+    lower_map = {name.lower(): name for name in _net_if_addrs_cached(bucket)}
+    for special in _SPECIAL_INTERFACES:
+        name = lower_map.get(special)
+        if name is not None:
+            return name
+    return None
+
+
 # 获取接口IP地址
-def get_interface_ip(interface_name: str | None) -> IPv4Address | None:
-    special_interfaces = ["wlan", "以太网", "ethernet"]  # 需要检查的接口名称列表
+# 单次运行只查询一次，cache_ttl 不作为配置项；以后改为常驻进程时，
+# 同一时间桶内的多次查询会复用同一次接口枚举
+def get_interface_ip(interface_name: str | None, cache_ttl: int = 5) -> str | None:
     try:
         # 获取所有网络接口
-        net_if_addrs = psutil.net_if_addrs()
-        netif = []
+        if cache_ttl > 0:
+            bucket = int(time.monotonic() // cache_ttl)
+        else:
+            bucket = time.monotonic_ns()
 
         if interface_name is None:
-            # 如果没有指定接口名称，则返回第一个接口为某个列表中（比如“WLAN”，“以太网”）的IPV4地址
-            for name, addrs in net_if_addrs.items():
-                if name.lower() in special_interfaces:
-                    netif = addrs
-                    break
-        else:
-            if interface_name not in net_if_addrs:
-                raise ValueError(f"找不到接口: {interface_name}")
-            netif = net_if_addrs[interface_name]
+            # 如果没有指定接口名称，则返回某个常用接口（比如“WLAN”，“以太网”）的IPV4地址
+            interface_name = _special_interface_name(bucket)
+        elif interface_name not in _net_if_addrs_cached(bucket):
+            raise ValueError(f"找不到接口: {interface_name}")
 
-        # 获取IPv4地址
-        for addr in netif:
+        # 只检查所选接口的地址，返回第一个可用的IPv4地址
+        for addr in _net_if_addrs_cached(bucket).get(interface_name, ()):
             if addr.family == socket.AF_INET:  # IPv4
                 ip = IPv4Address(addr.address)
                 # 检查不是回环地址、链路本地地址和保留地址
                 if not ip.is_loopback and not ip.is_link_local and not ip.is_reserved:
-                    return ip
+                    # 直接返回 psutil 给出的字符串，发送更新时无需再转换
+                    return addr.address
     except Exception as e:
-        logger.error(f"获取接口IP地址失败: {e}")
+        logger.error("获取接口IP地址失败: %s", e)
 
     return None
 
 
-# 解析命令行参数
-def parse_args():
+# 命令行选项定义，同时用于快速解析和构造 argparse 解析器
+_CLI_OPTIONS: dict[str, dict] = {
+    "--name-server": {
+        "action": "append",
+        "dest": "name_servers",
+        "help": "DNS服务器地址，可多次指定",
+    },
+    "--zone": {"help": "DNS区域"},
+    "--hostname": {
+        "action": "append",
+        "dest": "hostnames",
+        "help": "主机名，可多次指定",
+    },
+    "--ttl": {"type": int, "help": "DNS记录TTL"},
+    "--timeout": {"type": int, "help": "连接超时(秒)"},
+    "--protocol": {"choices": ["tcp", "udp"], "help": "通讯协议"},
+    "--interface": {"help": "网络接口名称"},
+    "--log-level": {"choices": ["info", "debug"], "help": "日志级别"},
+    "--tsig-name": {"help": "TSIG密钥名称"},
+    "--tsig-algorithm": {
+        "choices": ["hmac-sha256", "hmac-sha384", "hmac-sha512"],
+        "help": "TSIG算法",
+        "default": "hmac-sha256",
+    },
+    "--tsig-secret": {"help": "TSIG密钥(Base64编码)"},
+    "--force": {
+        "action": "store_true",
+        "help": "忽略状态文件，强制发送更新",
+        "default": False,
+    },
+}
+
+# 组成TSIG密钥的命令行参数，不直接对应配置字段
+_CLI_TSIG_KEYS = ("tsig_name", "tsig_algorithm", "tsig_secret")
+
+
+def _cli_dest(option: str, spec: dict) -> str:
+    return spec.get("dest", option[2:].replace("-", "_"))
+
+
+# 构造argparse解析器，仅在需要输出帮助或错误信息时使用
+def _build_arg_parser():
+    import argparse
+
     parser = argparse.ArgumentParser(description="DDNS客户端")
-    parser.add_argument("--name-server", help="DNS服务器地址")
-    parser.add_argument("--zone", help="DNS区域")
-    parser.add_argument("--hostname", help="主机名")
-    parser.add_argument("--ttl", type=int, help="DNS记录TTL", default=300)
-    parser.add_argument("--timeout", type=int, help="连接超时(秒)", default=5)
-    parser.add_argument(
-        "--protocol", choices=["tcp", "udp"], help="通讯协议", default="udp"
+    for option, spec in _CLI_OPTIONS.items():
+        parser.add_argument(option, **spec)
+    return parser
+
+
+# 解析命令行参数，常规参数直接解析，避免导入和构造argparse
+def parse_args(argv: list[str] | None = None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = SimpleNamespace()
+    for option, spec in _CLI_OPTIONS.items():
+        setattr(args, _cli_dest(option, spec), spec.get("default"))
+
+    remaining = iter(argv)
+    for arg in remaining:
+        option, sep, value = arg.partition("=")
+        spec = _CLI_OPTIONS.get(option)
+        if spec is None:
+            break
+        if spec.get("action") == "store_true":
+            if sep:
+                break
+            setattr(args, _cli_dest(option, spec), True)
+            continue
+        if not sep:
+            value = next(remaining, None)
+            if value is None or value.startswith("-"):
+                break
+        try:
+            value = spec.get("type", str)(value)
+        except ValueError:
+            break
+        if value not in spec.get("choices", (value,)):
+            break
+        dest = _cli_dest(option, spec)
+        if spec.get("action") == "append":
+            value = (getattr(args, dest) or []) + [value]
+        setattr(args, dest, value)
+    else:
+        return args
+
+    # 无法识别的参数(包括 -h/--help)交给argparse处理，输出帮助或错误信息
+    return _build_arg_parser().parse_args(argv)
+
+
+# 读取上次成功更新的状态，文件不存在或内容无效时返回空字典
+def load_state(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.debug("读取状态文件失败: %s", e)
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+# 写入状态文件，先写临时文件再替换，避免中断时留下损坏的文件
+# 每次写入使用各自的临时文件，同时运行的多个实例不会互相覆盖
+def save_state(path: str, state: dict):
+    import tempfile
+
+    directory = os.path.dirname(path) or "."
+    tmp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=directory
+        )
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error("写入状态文件失败: %s", e)
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+# 准备TSIG keyring，只依赖配置，启动时构造一次
+def build_keyring(tsig: list[TSIGKey]) -> dict:
+    import dns.tsigkeyring
+
+    return dns.tsigkeyring.from_text(
+        {key.name: (key.algorithm, key.secret) for key in tsig},
     )
-    parser.add_argument("--interface", help="网络接口名称")
-    parser.add_argument(
-        "--log-level",
-        choices=["info", "debug"],
-        help="日志级别",
-        default="info",
+
+
+# 按区域构造Update消息，同一区域的多条记录合并到一个消息中
+def build_updates(
+    records: Iterable[tuple[str, str, int, str, str]],
+    keyring: dict,
+) -> dict[str, "dns.update.Update"]:
+    import dns.update
+
+    updates: dict[str, dns.update.Update] = {}
+    for zone, hostname, ttl, rdtype, value in records:
+        update = updates.get(zone)
+        if update is None:
+            update = updates[zone] = dns.update.Update(zone=zone, keyring=keyring)
+        update.replace(hostname, ttl, rdtype, value)
+    return updates
+
+
+# 更新失败时各响应码对应的说明，以 dns.rcode.to_text() 的结果为键
+_RCODE_MESSAGES = {
+    "NXDOMAIN": "域名不存在",
+    "SERVFAIL": "服务失败",
+    "NOTAUTH": "未授权",
+    "NOTZONE": "非区域",
+    "REFUSED": "请求被拒绝",
+}
+
+
+# DNS更新客户端，在多次发送之间复用同一个TCP连接或UDP套接字
+class DDNSClient:
+    def __init__(
+        self,
+        name_server: str,
+        protocol: str = "udp",
+        timeout: float = 5,
+        port: int = 53,
+        max_idle_ms: int = 10000,
+    ):
+        if protocol not in self._SENDERS:
+            raise ValueError(f"不支持的协议: {protocol}")
+        self.name_server = name_server
+        self.protocol = protocol
+        self.timeout = timeout
+        self.port = port
+        self.max_idle_ms = max_idle_ms
+        self._tcp_sock: socket.socket | None = None
+        self._tcp_last_used = 0.0
+        self._udp_sock: socket.socket | None = None
+        # 协议在构造时确定，发送时直接调用对应的方法
+        self._sender = self._SENDERS[protocol]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._close_tcp()
+        if self._udp_sock is not None:
+            self._udp_sock.close()
+            self._udp_sock = None
+
+    def _close_tcp(self):
+        if self._tcp_sock is not None:
+            self._tcp_sock.close()
+            self._tcp_sock = None
+
+    # 获取TCP连接，建立连接只使用 expiration 之前剩余的时间
+    # 连接超时与 dns.query 一样抛出 Timeout
+    def _tcp_connection(self, expiration: float) -> socket.socket:
+        import dns.exception
+
+        if self._tcp_sock is None:
+            timeout = expiration - time.monotonic()
+            if timeout <= 0:
+                raise dns.exception.Timeout(timeout=self.timeout)
+            try:
+                self._tcp_sock = socket.create_connection(
+                    (self.name_server, self.port), timeout=timeout
+                )
+            except TimeoutError as e:  # socket.timeout 是 TimeoutError 的别名
+                raise dns.exception.Timeout(timeout=self.timeout) from e
+            self._tcp_sock.setblocking(False)
+        return self._tcp_sock
+
+    def _tcp_query(self, update: "dns.update.Update", expiration: float):
+        import dns.query
+
+        sock = self._tcp_connection(expiration)
+        return dns.query.tcp(
+            update,
+            self.name_server,
+            timeout=max(expiration - time.monotonic(), 0),
+            port=self.port,
+            sock=sock,
+        )
+
+    def _send_tcp(self, update: "dns.update.Update"):
+        # 建立连接、发送和重试共用同一个超时时间
+        expiration = time.monotonic() + self.timeout
+        # 空闲超过 max_idle_ms 的连接可能已被服务器关闭，直接重建
+        idle_ms = (time.monotonic() - self._tcp_last_used) * 1000
+        if idle_ms > self.max_idle_ms:
+            self._close_tcp()
+        reused = self._tcp_sock is not None
+        try:
+            try:
+                response = self._tcp_query(update, expiration)
+            except (ConnectionError, EOFError):
+                # 只有复用的连接可能已被服务器关闭，重新连接后重试一次；
+                # 新建连接失败时重试没有意义
+                if not reused:
+                    raise
+                self._close_tcp()
+                response = self._tcp_query(update, expiration)
+        except BaseException:
+            # 出错后连接中的数据流状态未知，不再复用
+            self._close_tcp()
+            raise
+        self._tcp_last_used = time.monotonic()
+        return response
+
+    # 获取UDP套接字，只创建和绑定一次
+    def _udp_socket(self) -> socket.socket:
+        import dns.inet
+
+        if self._udp_sock is None:
+            af = dns.inet.af_for_address(self.name_server)
+            self._udp_sock = socket.socket(af, socket.SOCK_DGRAM)
+            self._udp_sock.bind(("", 0))
+            self._udp_sock.setblocking(False)
+        return self._udp_sock
+
+    def _send_udp(self, update: "dns.update.Update"):
+        import dns.query
+
+        return dns.query.udp(
+            update,
+            self.name_server,
+            timeout=self.timeout,
+            port=self.port,
+            sock=self._udp_socket(),
+        )
+
+    # 协议到发送方法的映射，只允许其中列出的协议
+    _SENDERS = {"tcp": _send_tcp, "udp": _send_udp}
+
+    def query(self, update: "dns.update.Update"):
+        return self._sender(self, update)
+
+    # 发送Update消息并记录结果，更新成功时返回 True
+    def send_update(
+        self, zone: str, update: "dns.update.Update", hostnames: list[str]
+    ) -> bool:
+        import dns.exception
+
+        try:
+            response = self.query(update)
+        except (dns.exception.DNSException, OSError) as e:
+            # 连接被拒绝、网络不可达等套接字错误同样记录为更新失败
+            _log_failure(self.name_server, update, hostnames, e)
+            return False
+        return _check_response(self.name_server, zone, update, hostnames, response)
+
+
+# 记录响应结果，更新成功时返回 True
+def _check_response(
+    name_server: str,
+    zone: str,
+    update: "dns.update.Update",
+    hostnames: list[str],
+    response,
+) -> bool:
+    import dns.rcode
+
+    rcode = response.rcode()
+    if rcode == dns.rcode.NOERROR:
+        logger.info(
+            "DNS更新成功: id(%s), zone: %s, DNS服务器: %s",
+            response.id,
+            zone,
+            name_server,
+        )
+        success = True
+    else:
+        reason = _RCODE_MESSAGES.get(dns.rcode.to_text(rcode))
+        if reason is not None:
+            logger.error("DNS更新失败: %s，hostname: %s", reason, ", ".join(hostnames))
+        else:
+            logger.error(
+                "DNS更新失败: 更新过程出现未知错误 %s，hostname: %s\n%s",
+                rcode,
+                ", ".join(hostnames),
+                response,
+            )
+        success = False
+    logger.debug(
+        "更新信息： %s, DNS服务器： %s DNS响应: %s\n%s",
+        update,
+        name_server,
+        rcode,
+        response,
     )
-    parser.add_argument("--tsig-name", help="TSIG密钥名称")
-    parser.add_argument(
-        "--tsig-algorithm",
-        choices=["hmac-sha256", "hmac-sha384", "hmac-sha512"],
-        help="TSIG算法",
-        default="hmac-sha256",
+    return success
+
+
+def _log_failure(
+    name_server: str, update: "dns.update.Update", hostnames: list[str], e
+):
+    logger.error("DNS更新失败: %s", e, exc_info=True)
+    logger.debug(
+        "更新信息: %s, Hostname: %s, DNS服务器: %s",
+        update,
+        ", ".join(hostnames),
+        name_server,
     )
-    parser.add_argument("--tsig-secret", help="TSIG密钥(Base64编码)")
 
-    return parser.parse_args()
 
+# 异步发送只用于同时更新多个服务器，每个服务器只发送一次，不需要复用套接字
+async def _query_tcp_async(
+    update: "dns.update.Update", name_server: str, timeout: float, port: int
+):
+    import dns.asyncquery
+
+    return await dns.asyncquery.tcp(update, name_server, timeout=timeout, port=port)
+
+
+async def _query_udp_async(
+    update: "dns.update.Update", name_server: str, timeout: float, port: int
+):
+    import dns.asyncquery
+
+    return await dns.asyncquery.udp(update, name_server, timeout=timeout, port=port)
 
-# 主函数
-def main():
+
+# 协议到异步发送函数的映射，与 DDNSClient._SENDERS 一致
+_ASYNC_QUERIES = {"tcp": _query_tcp_async, "udp": _query_udp_async}
+
+
+# 异步发送Update消息并记录结果，更新成功时返回 True
+async def send_update_async(
+    name_server: str,
+    zone: str,
+    update: "dns.update.Update",
+    hostnames: list[str],
+    protocol: str = "udp",
+    timeout: float = 5,
+    port: int = 53,
+) -> bool:
+    import dns.exception
+
+    query = _ASYNC_QUERIES.get(protocol)
+    if query is None:
+        raise ValueError(f"不支持的协议: {protocol}")
+    try:
+        response = await query(update, name_server, timeout, port)
+    except (dns.exception.DNSException, OSError) as e:
+        # 单个服务器不可达时只记录失败，不影响其他服务器
+        _log_failure(name_server, update, hostnames, e)
+        return False
+    return _check_response(name_server, zone, update, hostnames, response)
+
+
+# 向所有DNS服务器发送更新，全部成功时返回 True
+# 只有一个服务器时走同步路径并复用连接；多个服务器时并发发送，总耗时取决于最慢的服务器
+def send_to_name_servers(
+    name_servers: list[str],
+    records: list[tuple[str, str, int, str, str]],
+    hostnames: list[str],
+    keyring: dict,
+    protocol: str = "udp",
+    timeout: float = 5,
+) -> bool:
+    if len(name_servers) == 1:
+        with DDNSClient(name_servers[0], protocol=protocol, timeout=timeout) as client:
+            results = [
+                client.send_update(zone, update, hostnames)
+                for zone, update in build_updates(records, keyring).items()
+            ]
+        return all(results)
+
+    import asyncio
+
+    async def send_all():
+        # 签名后的消息会记下请求的MAC用于校验响应，每个服务器需要各自的消息
+        sends = [
+            send_update_async(
+                name_server, zone, update, hostnames, protocol=protocol, timeout=timeout
+            )
+            for name_server in name_servers
+            for zone, update in build_updates(records, keyring).items()
+        ]
+        return await asyncio.gather(*sends)
+
+    return all(asyncio.run(send_all()))
+
+
+# 主函数，force 为 True 时忽略状态文件
+def main(force: bool = False):
     # 检查必要参数
-    if config.name_server is None or config.name_server == "":
+    if config.name_servers == []:
         logger.error("未指定DNS服务器地址")
         sys.exit(1)
     if config.zone == "":
         logger.error("未指定DNS区域")
         sys.exit(1)
-    if config.hostname == "":
+    if config.hostnames == []:
         logger.error("未指定主机名")
         sys.exit(1)
     if config.tsig == []:
         logger.error("未指定TSIG密钥信息")
         sys.exit(1)
 
-    # 准备TSIG keyring
-    keyring = dns.tsigkeyring.from_text(
-        {key.name: (key.algorithm, key.secret) for key in config.tsig},
-    )
-
     # 获取IP地址
     ip_address = get_interface_ip(config.interface)
     if ip_address is None:
-        logger.error(f"无法从接口 {config.interface} 获取IP地址")
+        logger.error("无法从接口 %s 获取IP地址", config.interface)
         sys.exit(1)
 
-    logger.info(f"正在更新DNS记录: {config.hostname}.{config.zone} -> {ip_address}")
-
-    # 构造Update消息
-    update = dns.update.Update(
-        zone=config.zone,
-        keyring=keyring,
+    records = [
+        (config.zone, hostname, config.ttl, "A", ip_address)
+        for hostname in config.hostnames
+    ]
+    name_servers = [name_server.compressed for name_server in config.name_servers]
+
+    # 与上次成功更新的记录完全一致时无需再次发送
+    state_file = os.path.expanduser(config.state_file)
+    state = load_state(state_file)
+    if (
+        not force
+        and state.get("name_servers") == name_servers
+        and state.get("records") == [list(record) for record in records]
+    ):
+        logger.info("IP地址未变化(%s)，跳过DNS更新", ip_address)
+        return
+
+    for hostname in config.hostnames:
+        logger.info("正在更新DNS记录: %s.%s -> %s", hostname, config.zone, ip_address)
+
+    # 发送更新请求，每个区域只发送一个Update消息，多个服务器时并发发送
+    success = send_to_name_servers(
+        name_servers,
+        records,
+        config.hostnames,
+        keyring,
+        protocol=config.protocol,
+        timeout=config.timeout,
     )
 
-    update.replace(config.hostname, config.ttl, "A", ip_address.compressed)
-
-    # 发送更新请求
-    try:
-        if config.protocol in dir(dns.query):
-            query_executor = getattr(dns.query, config.protocol)
-            response = query_executor(
-                update,
-                config.name_server.compressed,
-                timeout=config.timeout,
-            )
-        else:
-            raise ValueError(f"不支持的协议: {config.protocol}")
-
-        if response.rcode() == dns.rcode.NOERROR:
-            logger.info(f"DNS更新成功: id({response.id})")
-        elif response.rcode() == dns.rcode.NXDOMAIN:
-            logger.error(
-                f"DNS更新失败: 域名不存在，hostname: {config.hostname}", exc_info=True
-            )
-        elif response.rcode() == dns.rcode.SERVFAIL:
-            logger.error(
-                f"DNS更新失败: 服务失败，hostname: {config.hostname}", exc_info=True
-            )
-        elif response.rcode() == dns.rcode.NOTAUTH:
-            logger.error(
-                f"DNS更新失败: 未授权，hostname: {config.hostname}", exc_info=True
-            )
-        elif response.rcode() == dns.rcode.NOTZONE:
-            logger.error(
-                f"DNS更新失败: 非区域，hostname: {config.hostname}", exc_info=True
-            )
-        elif response.rcode() == dns.rcode.REFUSED:
-            logger.error(
-                f"DNS更新失败: 请求被拒绝，hostname: {config.hostname}", exc_info=True
-            )
-        else:
-            logger.error(
-                f"DNS更新失败: 更新过程出现未知错误 {response.rcode()}\n{response}",
-                exc_info=True,
-            )
-        logger.debug(
-            f"更新信息： {update}, DNS服务器： {config.name_server} DNS响应: {response.rcode()}\n{response}"
-        )
-    except dns.exception.DNSException as e:
-        logger.error(f"DNS更新失败: {e}", exc_info=True)
-        logger.debug(
-            f"更新信息: {update}, Hostname: {config.hostname}, DNS服务器: {config.name_server}"
+    # 全部更新成功后才记录状态，失败时下次运行会重新发送
+    # 是否跳过只比较 name_servers 和 records，ip 和 ts 仅供查看上次更新的地址和时间
+    if success:
+        save_state(
+            state_file,
+            {
+                "ip": ip_address,
+                "ts": time.time(),
+                "name_servers": name_servers,
+                "records": records,
+            },
         )
 
 
 if __name__ == "__main__":
     args = parse_args()
 
-    config = Config()
-
-    # 命令行参数覆盖配置文件
-    if args.name_server is not None:
-        config.name_server = args.name_server
-    if args.zone is not None:
-        config.zone = args.zone
-    if args.hostname is not None:
-        config.hostname = args.hostname
-    if args.ttl is not None:
-        config.ttl = args.ttl
-    if args.timeout is not None:
-        config.timeout = args.timeout
-    if args.protocol is not None:
-        config.protocol = args.protocol
-    if args.interface is not None:
-        config.interface = args.interface
-    if args.log_level is not None:
-        config.log_level = args.log_level
+    # 命令行参数覆盖配置文件，合并后一次性构造配置，只做一次校验
+    overrides = {
+        key: value
+        for key, value in vars(args).items()
+        if value is not None and key not in ("force", *_CLI_TSIG_KEYS)
+    }
     if args.tsig_name is not None and args.tsig_secret is not None:
-        config.tsig.append(
+        overrides["tsig"] = [
             TSIGKey(
                 name=args.tsig_name,
                 algorithm=args.tsig_algorithm,
                 secret=args.tsig_secret,
             )
-        )
-
-    # 确保zone以点号结尾
-    config.zone = f"{config.zone}." if not config.zone.endswith(".") else config.zone
+        ]
+    config = load_config("config.toml", overrides)
 
     # 设置日志级别
-    logger = setup_logging(config.log_level)
-    main()
+    logger = setup_logging(config.logging_level)
+    keyring = build_keyring(config.tsig)
+    main(force=args.force)